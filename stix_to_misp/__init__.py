@@ -0,0 +1,9 @@
+# stix_to_misp converts STIX packages into MISP events.  stix-to-misp.py is a
+# command line wrapper around it.
+
+from .parse import create_attributes, load_package, package_uuid, iter_attributes, create_event, parse_package
+from .misp import parse_distribution, parse_threat_level, serialize_event, create_misp_event
+from .converter import Converter
+from .profiling import PackageProfiler
+from .cache import AttributeCache
+from .warninglists import Warninglists
@@ -0,0 +1,70 @@
+import collections
+
+# A bounded LRU cache of parsed Cybox properties.  In large CISCP packages the
+# same IP, domain or hash shows up under dozens of indicators, and there's no
+# point running each copy through its xsiparsers parser again.  The cache is
+# keyed on the xsi:type plus whatever the parser's key() method returns (the
+# handful of properties parse() reads), and holds the bare attributes returned
+# by the parser.  Parsers without a key() method aren't cached.  A parser's
+# key() has to be kept in step with what its parse() reads, and has to stay
+# cheaper than parsing, or the cache just slows things down.
+# Per-indicator fields (timestamp, comment, etc.) are added by
+# create_attributes() after the lookup, so each hit gets its own copies.
+#
+# One cache can be shared across every package in a batch run.
+class AttributeCache():
+	def __init__(self, maxsize=1024):
+		self.maxsize = maxsize
+		self.entries = collections.OrderedDict()
+		self.hits    = 0
+		self.misses  = 0
+
+	# Return copies of the cached attributes, or None on a miss.  The copies
+	# are shallow, which is only safe while parser output stays a flat dict
+	# of strings and numbers.
+	def get(self, key):
+		try:
+			attributes = self.entries.get(key)
+		except TypeError:
+			# Some Cybox values are lists, which can't be hashed
+			self.misses += 1
+			return None
+		if attributes is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.entries.move_to_end(key)
+		return [dict(attribute) for attribute in attributes]
+
+	def put(self, key, attributes):
+		try:
+			self.entries[key] = [dict(attribute) for attribute in attributes]
+		except TypeError:
+			return
+		self.entries.move_to_end(key)
+		if len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+
+	def hit_rate(self):
+		lookups = self.hits + self.misses
+		if not lookups:
+			return 0.0
+		return self.hits / lookups
+
+	def __str__(self):
+		return "%d hits, %d misses (%.1f%% hit rate), %d/%d entries" % (
+			self.hits, self.misses, self.hit_rate() * 100, len(self.entries), self.maxsize
+		)
+
+# Cache key for the file parsers (FileObjectType, PDFFileObjectType and
+# WindowsExecutableFileObjectType), which all read the file name and hashes
+def file_key(properties):
+	hashes = ()
+	if properties.hashes:
+		hashes = tuple(
+			(hash_.type_.value,
+			 hash_.simple_hash_value.value if hash_.simple_hash_value else None,
+			 hash_.fuzzy_hash_value.value if hash_.fuzzy_hash_value else None)
+			for hash_ in properties.hashes
+		)
+	return (str(properties.file_name), bool(properties.file_name), hashes)
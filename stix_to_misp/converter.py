@@ -0,0 +1,89 @@
+from .parse import load_package, iter_attributes, create_event
+from .misp import parse_distribution, parse_threat_level
+from .cache import AttributeCache
+from .warninglists import Warninglists
+
+# Converts STIX packages into MISP events.  The event settings (distribution,
+# threat level, tags, and sharing group) are given once when the converter is
+# created and applied to every event it produces, so a single converter can
+# be reused for any number of packages.
+#
+# If cache_size is set, parsed Cybox properties are memoized in an LRU cache
+# of that many entries that lives as long as the converter, so repeated
+# observables are only parsed once per batch.  It's off by default: the
+# parsers are cheap enough that it hasn't yet been shown to help.
+#
+# If warninglists (a Warninglists object) is given, attributes on a warninglist
+# are dropped, or kept with to_ids cleared if warninglist_action is 'no-ids'.
+#
+#   converter = Converter(distribution='community', threat_level='medium', tags=['AIS'])
+#   for event in converter.iter_events(packages):
+#       ...
+class Converter():
+	def __init__(self, distribution='org', threat_level='low', tags=None, sharing_group=None, cache_size=0, warninglists=None, warninglist_action='drop'):
+		# distribution may also be a sharing group UUID, in which
+		# case it's the same as passing sharing_group.
+		self.distribution, self.sharing_group = parse_distribution(distribution)
+		if sharing_group:
+			self.distribution  = 4
+			self.sharing_group = sharing_group
+		self.threat_level_id = parse_threat_level(threat_level)
+		self.tags = list(tags or [])
+		if cache_size:
+			self.cache = AttributeCache(cache_size)
+		else:
+			self.cache = None
+		if warninglist_action not in Warninglists.ACTIONS:
+			raise ValueError("Warninglist action must be 'drop' or 'no-ids'")
+		self.warninglists       = warninglists
+		self.warninglist_action = warninglist_action
+
+	# Lazily generate MISP attributes from a STIX package.  The source may
+	# be a file name, a file object, the raw XML as bytes, an lxml tree, or
+	# an already-parsed STIXPackage.
+	def iter_attributes(self, source):
+		return self.filter(iter_attributes(load_package(source), self.cache))
+
+	# Convert a STIX package into a MISP event.  If comment is given, it's
+	# added to the event as a comment attribute (e.g. the input file name).
+	# If profile (a PackageProfile) is given, it's labeled with the package
+	# id and its allocation snapshot is taken before the package is freed.
+	def convert(self, source, comment=None, profile=None):
+		pkg = load_package(source)
+		attributes = list(self.filter(iter_attributes(pkg, self.cache)))
+		if comment:
+			attributes.append({
+				'category'     : 'Other',
+				'type'         : 'comment',
+				'value'        : comment,
+				'to_ids'       : 0,
+				'distribution' : 5
+			})
+		event = create_event(pkg, attributes)
+
+		# Set the distribution and threat level
+		event['distribution']    = self.distribution
+		event['threat_level_id'] = self.threat_level_id
+
+		# If we have a sharing group uuid, add it here
+		if self.sharing_group:
+			event['SharingGroup']['uuid'] = self.sharing_group
+
+		for tag_name in self.tags:
+			event['Tag'].append({ 'name' : tag_name })
+
+		if profile is not None:
+			profile.label = pkg.id_
+			profile.take_snapshot()
+		return event
+
+	# Check attributes against the warninglists, if we have any
+	def filter(self, attributes):
+		if self.warninglists is None:
+			return attributes
+		return self.warninglists.filter(attributes, self.warninglist_action)
+
+	# Lazily convert a sequence of STIX packages into MISP events
+	def iter_events(self, sources):
+		for source in sources:
+			yield self.convert(source)
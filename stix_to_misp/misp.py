@@ -0,0 +1,137 @@
+import json
+import re
+import requests
+
+# orjson is optional.  If it's installed, we'll use it to serialize events.
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+from .parse import UUID_RE
+
+# Turn a distribution setting into a MISP distribution id and
+# (optionally) a sharing group UUID.
+#
+# "org" means the event is only visible to your own org
+# "community" means the event is visible to anyone who can log into your MISP
+# "connected" shares with all connected MISP instances
+# "all" shares with connected instances and instances connected to them
+# A sharing group UUID will share based on the sharing group's settings
+# The MISP UI doesn't expose sharing group UUIDs, so you have to use the DB.
+# mysql> select name, uuid from misp.sharing_groups;
+def parse_distribution(distribution):
+	if distribution in [0, 1, 2, 3, 4]:
+		return distribution, None
+	elif distribution in ["0", "1", "2", "3", "4"]:
+		return int(distribution), None
+	elif distribution == "org":
+		return 0, None
+	elif distribution == "community":
+		return 1, None
+	elif distribution == "connected":
+		return 2, None
+	elif distribution == "all":
+		return 3, None
+	elif re.match(UUID_RE, str(distribution)):
+		return 4, distribution
+	else:
+		raise ValueError("Distribution must be 'org', 'community', 'connected', 'all', or a sharing group UUID")
+
+# Turn a threat level setting into a MISP threat level id
+def parse_threat_level(level):
+	if level in [1, 2, 3, 4]:
+		return level
+	elif level in ["1", "2", "3", "4"]:
+		return int(level)
+	elif level == "high":
+		return 1
+	elif level == "medium":
+		return 2
+	elif level == "low":
+		return 3
+	elif level == "undefined":
+		return 4
+	else:
+		raise ValueError("Threat level must be 'high', 'medium', 'low', or 'undefined'")
+
+# Generate the JSON for { 'Event' : event } with orjson.  orjson has no
+# incremental encoder, so we write the envelope by hand and encode the
+# attributes one at a time.  That way no single piece grows with the size
+# of the event.
+def iter_orjson(event):
+	header = dict(event)
+	attributes = header.pop('Attribute', [])
+	# orjson.dumps(header) is e.g. {"uuid":...,"Tag":[]}.  Drop the
+	# closing brace so we can add the attributes after it.
+	header = orjson.dumps(header)[:-1]
+	if header != b'{':
+		header += b','
+	yield b'{"Event":' + header + b'"Attribute":['
+	for index, attribute in enumerate(attributes):
+		if index:
+			yield b',' + orjson.dumps(attribute)
+		else:
+			yield orjson.dumps(attribute)
+	yield b']}}'
+
+# Serialize a MISP event into chunks of compact JSON.  Large events can run
+# to many megabytes, so rather than building one big string we hand the
+# HTTP layer a generator and let requests send it with chunked encoding.
+# If orjson is installed we use it instead, since it's much faster and
+# produces bytes directly.  If echo is set, each chunk is also written to
+# it (e.g. sys.stdout) as it goes out, so the event is only serialized once.
+def serialize_event(event, echo=None, chunk_size=65536):
+	if orjson:
+		chunks = iter_orjson(event)
+	else:
+		encoder = json.JSONEncoder(separators=(',', ':'))
+		chunks = encoder.iterencode({ 'Event' : event })
+
+	# Text streams like sys.stdout have a binary buffer underneath.  Write
+	# the bytes straight to it rather than decoding them again.  Anything
+	# already written to the text layer has to be flushed first so the
+	# output stays in order.
+	def write(data):
+		if echo is None:
+			return
+		if hasattr(echo, 'buffer'):
+			echo.buffer.write(data)
+		else:
+			echo.write(data.decode('utf-8'))
+
+	if echo is not None:
+		echo.flush()
+
+	# Both encoders yield lots of small pieces.  Buffer them up so we
+	# aren't sending a chunk per token.
+	buf = []
+	buf_len = 0
+	for chunk in chunks:
+		if isinstance(chunk, str):
+			chunk = chunk.encode('utf-8')
+		buf.append(chunk)
+		buf_len += len(chunk)
+		if buf_len >= chunk_size:
+			data = b''.join(buf)
+			write(data)
+			yield data
+			buf = []
+			buf_len = 0
+	if buf:
+		data = b''.join(buf)
+		write(data)
+		yield data
+	write(b'\n')
+	if echo is not None and hasattr(echo, 'buffer'):
+		echo.buffer.flush()
+
+# Create the event in MISP via the API
+def create_misp_event(misp_url, misp_key, event, verify_cert=True, echo=None):
+	headers = {
+		'Authorization' : misp_key,
+		'Content-Type'  : 'application/json',
+		'Accept'        : 'application/json'
+	}
+	response = requests.post(misp_url + '/events', headers=headers, data=serialize_event(event, echo), verify=verify_cert)
+	return(response)
@@ -0,0 +1,263 @@
+import io
+import json
+import logging
+import re
+import uuid
+
+from stix.core import STIXPackage, STIXHeader
+import stix.extensions.marking.ais
+
+from . import xsiparsers
+
+logger = logging.getLogger(__name__)
+
+UUID_RE = '^[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}$'
+
+# Create MISP attributes from a Cybox object.  Recursively create
+# attributes from related objects.  If an AttributeCache is given, parser
+# results are looked up there before running the parser.
+def create_attributes(object_, parent_value=None, misp_comment=None, indicator_timestamp=None, deref={}, cache=None):
+	# ident to make output more readable
+	indent = "   "
+
+	# This object might be a relation with an idref instead of an id
+	if object_.idref:
+		if object_.idref in deref:
+			object_ = deref[object_.idref]
+		else:
+			# We've already created this attribute, and the
+			# id has been popped from our object map.
+			return []
+
+
+	id_ = object_.id_
+
+	# Remove the object from the reference map, so we
+	# can clean up later by outputting all the objects
+	# that never got referenced.  This also prevents
+	# infinite recursion between objects with circular
+	# relations.
+	deref.pop(id_, None)
+
+	# Sometimes CISCP includes empty objects that don't even have an id
+	if not id_:
+		logger.warning("%s Empty Object?  No ID. %s", indent, json.dumps(object_.to_dict(), indent=1))
+		return []
+
+	# Sometimes AIS includes objects with no properties.  E.g. there will be a
+	# 'Resolved_To' relationship for an IP that doesn't have reverse DNS.
+	if not object_.properties:
+		logger.debug("%s %s, NO PROPERTIES", indent, id_)
+		return []
+
+	properties = object_.properties
+
+	# Is this a related object?  If so, we'll put the relationship
+	# in the MISP attribute comment.
+	if hasattr(object_, 'relationship'):
+		# object_.relationship.value is e.g. "Resolved_To"
+		# Set relationship_text to e.g. "resolved to"
+		relationship_text = object_.relationship.value.lower().replace('_', ' ')
+
+		# This shouldn't happen
+		if parent_value == None:
+			logger.error("Related object with no parent: %s", json.dumps(object_.to_dict(), indent=1))
+		assert parent_value != None
+
+		parent_value = str(parent_value)
+		# misp_comment set to e.g. "1.2.3.4 resolved to this"
+		misp_comment = parent_value + " " + relationship_text + " this"
+		indent = indent + "   " + parent_value + " " + object_.relationship.value + ":"
+
+	# List to hold the MISP attributes
+	attributes = []
+
+	# Create a MISP object based on the xsi:type of the Cybox object
+	xsi_type = properties._XSI_TYPE
+
+	# Set an initial value as a placeholder
+	value = xsi_type + '-' + id_
+
+	# Do we have a parser module for this xsi:type?
+	if hasattr(xsiparsers, xsi_type):
+		# Run the parser, unless we've already parsed an object
+		# with the same properties
+		parser = getattr(xsiparsers, xsi_type)
+		key = None
+		if cache is not None and hasattr(parser, 'key'):
+			# key() runs before parse() gets a chance to skip junk objects
+			# (e.g. file names like 'UNDER NCCIC REVIEW'), so it may trip
+			# over properties parse() would never read.  If it does, just
+			# parse without the cache.
+			try:
+				key = (xsi_type, parser.key(properties))
+			except (AttributeError, TypeError):
+				key = None
+		if key is not None:
+			attributes = cache.get(key)
+			if attributes is None:
+				attributes = parser.parse(properties)
+				cache.put(key, attributes)
+		else:
+			attributes = parser.parse(properties)
+		# If we got attributes back from the parser, add some additional MISP
+		# fields.  Also set the 'value' variable, which we'll use later if there
+		# are related objects and we need to recurse.
+		for attribute in attributes:
+			if attribute['type'] != 'text':
+				value = attribute['value']
+			logger.debug("%s %s, %s, %s, %s", indent, id_, xsi_type, attribute['type'], value)
+			attribute['distribution'] = 5
+			attribute['timestamp']    = indicator_timestamp
+			# The comment field will be the indicator description (if there is one) or
+			# information about the relationship to the parent object if this is a child
+			if misp_comment:
+				attribute['comment'] = misp_comment
+	else:
+		# No parser module for this xsi:type
+		logger.error("%s %s, %s, ???\n%s", indent, id_, xsi_type, json.dumps(properties.to_dict(), indent=1))
+		raise AttributeError("Unknown xsi:type")
+
+	# There may be related objects.  Recursively parse them.
+	if object_.related_objects:
+		for related_object in object_.related_objects:
+			if related_object.idref and related_object.idref in deref:
+				# If this related object has an idref, we need to store the relationship,
+				# dereference the object, and add the relationship to the reference object
+				relationship = related_object.relationship
+				related_object = deref[related_object.idref]
+				related_object.relationship = relationship
+			# Recurse
+			attributes = attributes + create_attributes(related_object, value, indicator_timestamp=indicator_timestamp, deref=deref, cache=cache)
+	return attributes
+
+# Load a STIX package.  The source may be a file name, a file object, the raw
+# XML as bytes, an lxml tree, or an already-parsed STIXPackage.
+def load_package(source):
+	if isinstance(source, STIXPackage):
+		return source
+	if isinstance(source, (bytes, bytearray)):
+		source = io.BytesIO(source)
+	return STIXPackage.from_xml(source)
+
+# Extract a UUID from the STIX Package ID.
+# E.g. NCCIC:STIX_Package-c6e42472-0055-4d55-ac9a-67af9ec39bb9
+#      becomes c6e42472-0055-4d55-ac9a-67af9ec39bb9
+def package_uuid(pkg):
+	uuid_ = pkg.id_.split('-', 1)[1]
+	# uuid needs to match /^[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}$/
+	# If it isn't well-formed, we'll generate a new one based on the package id
+	if not re.match(UUID_RE, uuid_):
+		uuid_ = uuid.uuid5(uuid.NAMESPACE_OID, pkg.id_)
+	return str(uuid_)
+
+# Generate MISP attributes from a parsed STIX package.  This is a generator,
+# so attributes are handed out as each indicator is processed rather than
+# being collected into one big list.  Duplicate values are skipped.
+def iter_attributes(pkg, cache=None):
+	if not pkg.indicators:
+		logger.info("No indicators")
+	logger.info("ID:    %s", pkg.id_)
+	logger.info("UUID:  %s", package_uuid(pkg))
+	# Extract the header from the package
+	header = pkg.stix_header
+	logger.info("Title: %s", header.title)
+	logger.info("Description: %s", header.description)
+
+	# Values we've already handed out
+	uniq = {}
+
+	def uniq_attributes(attributes):
+		for attribute in attributes:
+			if attribute['value'] not in uniq:
+				uniq[attribute['value']] = True
+				yield attribute
+
+	# If the package has a description, add it as an attribute
+	if header.description:
+		yield from uniq_attributes([{
+			'category'     : 'Other',
+			'type'         : 'comment',
+			'value'        : str(header.description),
+			'to_ids'       : 0,
+			'distribution' : 5
+		}])
+
+	# Create a dictionary to map objects to their ids so we can
+	# dereference them later.
+	deref = {}
+	if pkg.observables:
+		for observable in pkg.observables:
+			object_ = observable.object_
+			deref[object_.id_] = object_
+
+	# Run through the list of STIX Indicators
+	if pkg.indicators:
+		# Parse all the Observables from the Indicators
+		# and create MISP attributes from them
+		for indicator in pkg.indicators:
+			logger.debug("  %s", indicator.id_)
+			logger.debug("  %s", indicator.description)
+			logger.debug("  %s", indicator.title)
+			observable = indicator.observable
+			if not observable:
+				logger.warning("Indicator %s has no observable", indicator.id_)
+				continue
+			if indicator.observable.object_.idref:
+				if indicator.observable.object_.idref in deref:
+					object_ = deref[indicator.observable.object_.idref]
+				else:
+					logger.error("Indicator %s references observable object %s, which does not exist", indicator.id_, indicator.observable.object_.idref)
+					raise AttributeError("Indicator references a non-existent object")
+			else:
+				object_ = observable.object_
+			if indicator.timestamp:
+				ts = indicator.timestamp.strftime('%s')
+			else:
+				ts = None
+			yield from uniq_attributes(create_attributes(
+				object_,
+				misp_comment=str(indicator.description),
+				indicator_timestamp=ts,
+				deref=deref,
+				cache=cache
+			))
+
+	# CISCP STIX documents have observables that aren't tied to any indicators.
+	# Create MISP attributes for them here.
+	#
+	# This is actually kludgey.  For MIFRs, objects may be referenced from TTPs
+	# rather than Indicators.  To do this correctly, we really should parse TTPs.
+	for idref in list(deref.keys()):
+		# Each time create_attributes is called, it removes the key from
+		# the deref dict.  That prevents us from duplicating objects or
+		# recursing infinitely due to circular relations.
+		if idref in deref:
+			object_ = deref[idref]
+			yield from uniq_attributes(create_attributes(
+				object_,
+				deref=deref,
+				cache=cache
+			))
+
+# Create the MISP Event object structure for a package
+def create_event(pkg, attributes):
+	return {
+		'uuid'            : package_uuid(pkg),
+		'published'       : 1,
+		'info'            : pkg.id_,
+		'analysis'        : 2,
+		'timestamp'       : pkg.timestamp.strftime('%s'),
+		'Attribute'       : attributes,
+		'SharingGroup'    : {},
+		'Tag'             : []
+	}
+
+def parse_package(input_file, cache=None):
+	# Open the STIX package file and parse it
+	logger.info("### %s", input_file)
+	pkg = load_package(input_file)
+	attributes = list(iter_attributes(pkg, cache))
+
+	# Return the attributes and the MISP Event object structure
+	return attributes, create_event(pkg, attributes)
@@ -0,0 +1,118 @@
+import contextlib
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Profiles CPU time and memory allocations for one package at a time.  For
+# each profiled package, two files are written to output_dir, named after
+# the STIX package id plus a timestamp and counter, so a package that's sent
+# again doesn't overwrite its earlier profile:
+#
+#   <package id>.<time>.<n>.pstats     cProfile stats (load with pstats or snakeviz)
+#   <package id>.<time>.<n>.alloc.txt  the top allocation sites from tracemalloc
+#
+# The allocation report should show what's in memory while the package is
+# at its largest, not what's left after it has been freed.  Converter.convert()
+# takes that snapshot itself, while the parsed STIXPackage is still alive, if
+# it's passed the profile handle.  Otherwise the snapshot is taken when the
+# with block ends.
+#
+# sample_rate is the fraction of packages to profile (e.g. 0.01 profiles one
+# package in a hundred), so profiling can be left on for batch runs.  If
+# output_dir is None, nothing is profiled.
+#
+#   profiler = PackageProfiler('profiles', sample_rate=0.1)
+#   with profiler.profile() as prof:
+#       event = converter.convert(input_file, profile=prof)
+#       create_misp_event(misp_url, misp_key, event)
+class PackageProfiler():
+	def __init__(self, output_dir, sample_rate=1.0, top=25):
+		if not 0 <= sample_rate <= 1:
+			raise ValueError("Profile sample rate must be between 0 and 1")
+		self.output_dir  = output_dir
+		self.sample_rate = sample_rate
+		self.top         = top
+		# Used to label packages that never got a label, and to keep
+		# file names unique
+		self.count = 0
+
+	@contextlib.contextmanager
+	def profile(self):
+		self.count += 1
+		prof = PackageProfile("package-" + str(self.count))
+		if self.output_dir is None or random.random() >= self.sample_rate:
+			yield prof
+			return
+
+		# Someone else may already be tracing allocations.  If so,
+		# leave tracemalloc running when we're done.
+		started_tracemalloc = not tracemalloc.is_tracing()
+		if started_tracemalloc:
+			tracemalloc.start()
+		tracemalloc.reset_peak()
+		prof.active = True
+		profiler = cProfile.Profile()
+		start = time.perf_counter()
+		profiler.enable()
+		try:
+			yield prof
+		finally:
+			profiler.disable()
+			elapsed = time.perf_counter() - start
+			if prof.snapshot is None:
+				prof.take_snapshot()
+			current, peak = tracemalloc.get_traced_memory()
+			if started_tracemalloc:
+				tracemalloc.stop()
+			prof.active = False
+			self.write(prof, profiler, elapsed, peak)
+
+	# Write out the pstats file and allocation report for a package
+	def write(self, prof, profiler, elapsed, peak):
+		os.makedirs(self.output_dir, exist_ok=True)
+		# Package ids look like NCCIC:STIX_Package-c6e42472-...
+		# Keep them readable but safe to use as a file name.
+		name = re.sub('[^A-Za-z0-9._-]', '_', prof.label)
+		name = "%s.%s.%d" % (name, time.strftime('%Y%m%dT%H%M%S'), self.count)
+		path = os.path.join(self.output_dir, name)
+
+		profiler.dump_stats(path + ".pstats")
+
+		# Leave out allocations made by tracemalloc itself and the import system
+		snapshot = prof.snapshot.filter_traces([
+			tracemalloc.Filter(False, tracemalloc.__file__),
+			tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+			tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+		])
+		with open(path + ".alloc.txt", "w") as fh:
+			fh.write("Package: %s\n" % prof.label)
+			fh.write("Elapsed: %.3f s\n" % elapsed)
+			fh.write("Peak traced memory: %.1f KiB\n" % (peak / 1024))
+			fh.write("Traced memory at snapshot: %.1f KiB\n" % (prof.snapshot_size / 1024))
+			fh.write("Top %d allocation sites:\n" % self.top)
+			for stat in snapshot.statistics('lineno')[:self.top]:
+				fh.write(str(stat) + "\n")
+		logger.info("Profile: %s.pstats %s.alloc.txt", path, path)
+
+# The handle given out by PackageProfiler.profile().  Set label to the STIX
+# package id once it's known, and call take_snapshot() at the point where the
+# package is using the most memory.  Both do nothing useful if this package
+# isn't being profiled.
+class PackageProfile():
+	def __init__(self, label):
+		self.label         = label
+		self.active        = False
+		self.snapshot      = None
+		self.snapshot_size = 0
+
+	def take_snapshot(self):
+		if not self.active:
+			return
+		self.snapshot = tracemalloc.take_snapshot()
+		self.snapshot_size = tracemalloc.get_traced_memory()[0]
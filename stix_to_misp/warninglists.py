@@ -0,0 +1,223 @@
+import ipaddress
+import json
+import logging
+import os
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+# MISP warninglists (https://github.com/MISP/misp-warninglists) flag values
+# that are known to be benign: RFC1918 addresses, CDN ranges, top sites,
+# hashes of empty files, and so on.  Checking them inside MISP after the
+# event has been published is slow, so we load the warninglist JSON files
+# ourselves and check attributes before they're sent.
+#
+# Each list type is loaded into its own lookup structure:
+#
+#   cidr      For each address family, a dict per prefix length mapping
+#             masked network addresses (as ints) to lists.  A lookup masks
+#             the address once for each prefix length in use, so it costs at
+#             most 33 (or 129) dict lookups no matter how many ranges are
+#             loaded, and each range takes a single entry.
+#   hostname  A trie of domain labels in reverse order (com -> google ->
+#             www), so a lookup matches the domain or any parent domain in
+#             one step per label.
+#   string    A set of exact values (e.g. hashes).
+#
+# substring and regex lists can't be matched this way, so they're skipped.
+#
+# Like MISP, a list is only checked against the attribute types named in its
+# matching_attributes.  A list without matching_attributes applies to every
+# type.  Our parsers emit uri where MISP lists name url, so the two are treated
+# the same.  The host of a URL (or the domain of an email address) is also
+# checked against lists for hostname/domain, or ip-src/ip-dst if it's an IP.
+#
+#   warninglists = Warninglists()
+#   warninglists.load('misp-warninglists/lists')
+#   attributes = list(warninglists.filter(attributes, action='no-ids'))
+class Warninglists():
+	# What to do with an attribute that's on a warninglist
+	ACTIONS = ('drop', 'no-ids')
+
+	def __init__(self):
+		# The matching_attributes of each list, by name.  None means the
+		# list applies to every attribute type.
+		self.matching = {}
+		# Address family -> prefix length -> masked network address ->
+		# list names
+		self.cidrs = {
+			4 : {},
+			6 : {}
+		}
+		# The prefix lengths in use for each family, shortest first
+		self.prefixlens = {
+			4 : [],
+			6 : []
+		}
+		# Reversed-label trie.  The names of the lists a domain is on are
+		# stored under the key None at the node where the domain ends.
+		self.domains = {}
+		# Exact values, mapped to the names of the lists they're on
+		self.strings = {}
+
+	# Load a warninglist JSON file, or every .json file under a directory
+	# (e.g. the lists directory of a misp-warninglists checkout)
+	def load(self, path):
+		if os.path.isdir(path):
+			for dirpath, dirnames, filenames in os.walk(path):
+				for filename in sorted(filenames):
+					if filename.endswith('.json'):
+						self.load(os.path.join(dirpath, filename))
+			return
+		with open(path) as fh:
+			warninglist = json.load(fh)
+		if 'list' not in warninglist:
+			# Not a warninglist
+			return
+		self.add(warninglist)
+
+	# Add a parsed warninglist
+	def add(self, warninglist):
+		name = warninglist.get('name', 'unnamed warninglist')
+		type_ = warninglist.get('type', 'string')
+		if type_ not in ('cidr', 'hostname', 'string'):
+			logger.warning("Warninglist %s has type %s, which is not supported", name, type_)
+			return
+		if warninglist.get('matching_attributes'):
+			self.matching[name] = frozenset(warninglist['matching_attributes'])
+		else:
+			self.matching[name] = None
+		if type_ == 'cidr':
+			for value in warninglist['list']:
+				self.add_cidr(value, name)
+		elif type_ == 'hostname':
+			for value in warninglist['list']:
+				self.add_domain(value, name)
+		else:
+			for value in warninglist['list']:
+				self.strings.setdefault(value.lower(), []).append(name)
+
+	def add_cidr(self, value, name):
+		try:
+			network = ipaddress.ip_network(value.strip(), strict=False)
+		except ValueError:
+			return
+		networks = self.cidrs[network.version]
+		if network.prefixlen not in networks:
+			networks[network.prefixlen] = {}
+			self.prefixlens[network.version] = sorted(networks)
+		networks[network.prefixlen].setdefault(int(network.network_address), []).append(name)
+
+	def add_domain(self, value, name):
+		labels = value.strip().strip('.').lower().split('.')
+		node = self.domains
+		for label in reversed(labels):
+			node = node.setdefault(label, {})
+		node.setdefault(None, []).append(name)
+
+	# Return the first of names whose list applies to one of types, or None
+	def applicable(self, names, types):
+		if names:
+			for name in names:
+				matching = self.matching[name]
+				if matching is None or not matching.isdisjoint(types):
+					return name
+		return None
+
+	# Return the name of the list an IP address is on, or None
+	def match_ip(self, value, types):
+		try:
+			address = ipaddress.ip_address(value.strip())
+		except ValueError:
+			return None
+		bits = int(address)
+		networks = self.cidrs[address.version]
+		max_prefixlen = address.max_prefixlen
+		for prefixlen in self.prefixlens[address.version]:
+			# Clear the host bits, e.g. 10.1.2.3 becomes 10.0.0.0 for /8
+			masked = bits >> (max_prefixlen - prefixlen) << (max_prefixlen - prefixlen)
+			name = self.applicable(networks[prefixlen].get(masked), types)
+			if name:
+				return name
+		return None
+
+	# Return the name of the list a domain (or one of its parents) is on, or None
+	def match_domain(self, value, types):
+		labels = value.strip().rstrip('.').lower().split('.')
+		node = self.domains
+		for label in reversed(labels):
+			node = node.get(label)
+			if node is None:
+				return None
+			name = self.applicable(node.get(None), types)
+			if name:
+				return name
+		return None
+
+	# Match a host, which may be either an IP address or a domain.  types are
+	# the types of the attribute the host came from.
+	def match_host(self, value, types):
+		try:
+			ipaddress.ip_address(value)
+		except ValueError:
+			return self.match_domain(value, types + ('hostname', 'domain'))
+		return self.match_ip(value, types + ('ip-src', 'ip-dst'))
+
+	# Return the name of the list an attribute is on, or None
+	def match(self, attribute):
+		type_ = attribute['type']
+		value = str(attribute['value'])
+		if type_ in ('comment', 'text'):
+			return None
+		types = (type_,)
+		if type_ == 'uri':
+			types = ('uri', 'url')
+
+		name = self.applicable(self.strings.get(value.lower()), types)
+		if name:
+			return name
+		# For composites like filename|md5, the hash half can also match
+		# a list of bare hashes (e.g. one with matching_attributes md5).
+		# The file name half is never checked.
+		if '|' in type_ and '|' in value:
+			hash_type = type_.split('|', 1)[1]
+			hash_value = value.split('|', 1)[1]
+			name = self.applicable(self.strings.get(hash_value.lower()), (type_, hash_type))
+			if name:
+				return name
+
+		if type_ in ('ip-src', 'ip-dst'):
+			return self.match_ip(value, types)
+		elif type_ in ('domain', 'hostname'):
+			return self.match_domain(value, types)
+		elif type_ in ('uri', 'url'):
+			# URLs don't always have a scheme, which urlparse needs
+			# to find the host.
+			if '://' not in value:
+				value = 'http://' + value
+			try:
+				host = urllib.parse.urlparse(value).hostname
+			except ValueError:
+				return None
+			if host:
+				return self.match_host(host, types)
+		elif type_ == 'email-src':
+			if '@' in value:
+				return self.match_host(value.rsplit('@', 1)[1], types)
+		return None
+
+	# Generate the attributes with warninglisted ones either dropped or with
+	# to_ids cleared, depending on action.
+	def filter(self, attributes, action='drop'):
+		if action not in self.ACTIONS:
+			raise ValueError("Warninglist action must be 'drop' or 'no-ids'")
+		for attribute in attributes:
+			name = self.match(attribute)
+			if not name:
+				yield attribute
+			elif action == 'drop':
+				logger.info("Warninglist: %s is on %s, dropping it", attribute['value'], name)
+			else:
+				logger.info("Warninglist: %s is on %s, clearing to_ids", attribute['value'], name)
+				attribute['to_ids'] = 0
+				yield attribute
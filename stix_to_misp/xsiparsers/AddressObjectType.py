@@ -1,4 +1,7 @@
 class AddressObjectType():
+	def key(properties):
+		return (properties.address_value.value, properties.category, properties.is_source, properties.is_destination)
+
 	def parse(properties):
 		attributes = []
 		category = properties.category
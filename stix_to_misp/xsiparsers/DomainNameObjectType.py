@@ -1,6 +1,9 @@
 import re
 
 class DomainNameObjectType():
+	def key(properties):
+		return properties.value.value
+
 	def parse(properties):
 		attributes = []
 		value = properties.value.value.rstrip()
@@ -1,6 +1,11 @@
 import re
 
+from ..cache import file_key
+
 class PDFFileObjectType():
+	def key(properties):
+		return file_key(properties)
+
 	def parse(properties):
 		attributes = []
 		file_name = str(properties.file_name)
@@ -1,4 +1,7 @@
 class PortObjectType():
+	def key(properties):
+		return properties.port_value.value
+
 	def parse(properties):
 		attributes = []
 		value = properties.port_value.value
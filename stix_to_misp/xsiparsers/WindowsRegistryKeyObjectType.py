@@ -1,4 +1,7 @@
 class WindowsRegistryKeyObjectType():
+	def key(properties):
+		return (properties.hive.value if properties.hive else None, properties.key.value)
+
 	def parse(properties):
 		attributes = []
 		if properties.hive:
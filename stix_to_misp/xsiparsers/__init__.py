@@ -0,0 +1,12 @@
+# Import every parser module in this directory.  Each module defines a class
+# with the same name as the module (and the Cybox xsi:type it parses), e.g.
+# AddressObjectType.AddressObjectType.
+__all__ = []
+
+import importlib
+import pkgutil
+
+for loader, name, is_pkg in pkgutil.iter_modules(__path__):
+    module = importlib.import_module('.' + name, __name__)
+    globals()[name] = getattr(module, name)
+    __all__.append(name)
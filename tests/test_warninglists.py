@@ -0,0 +1,113 @@
+import pytest
+
+from stix_to_misp import Warninglists
+
+EMPTY_MD5 = 'd41d8cd98f00b204e9800998ecf8427e'
+
+def make_warninglists():
+	warninglists = Warninglists()
+	warninglists.add({
+		'name'                : 'RFC1918',
+		'type'                : 'cidr',
+		'matching_attributes' : ['ip-src', 'ip-dst'],
+		'list'                : ['10.0.0.0/8', '192.168.0.0/16', 'fc00::/7']
+	})
+	# Overlaps RFC1918, but only applies to ip-dst
+	warninglists.add({
+		'name'                : 'Resolvers',
+		'type'                : 'cidr',
+		'matching_attributes' : ['ip-dst'],
+		'list'                : ['8.8.8.0/24', '10.1.0.0/16', '2001:4860:4860::/48']
+	})
+	warninglists.add({
+		'name'                : 'Top sites',
+		'type'                : 'hostname',
+		'matching_attributes' : ['hostname', 'domain', 'url'],
+		'list'                : ['google.com', '.microsoft.com']
+	})
+	warninglists.add({
+		'name'                : 'Empty hashes',
+		'type'                : 'string',
+		'matching_attributes' : ['md5', 'filename|md5'],
+		'list'                : [EMPTY_MD5.upper()]
+	})
+	# File names, which should never match the file name half of a
+	# filename|md5
+	warninglists.add({
+		'name'                : 'File names',
+		'type'                : 'string',
+		'matching_attributes' : ['md5'],
+		'list'                : ['a.exe']
+	})
+	return warninglists
+
+def match(type_, value):
+	return make_warninglists().match({ 'type' : type_, 'value' : value })
+
+def test_ipv4():
+	assert match('ip-src', '10.1.2.3') == 'RFC1918'
+	assert match('ip-dst', '192.168.1.1') == 'RFC1918'
+	assert match('ip-src', '11.1.2.3') is None
+
+def test_ipv6():
+	assert match('ip-src', 'fd00::1') == 'RFC1918'
+	assert match('ip-dst', '2001:4860:4860::8888') == 'Resolvers'
+	assert match('ip-src', '2001:4860:4860::8888') is None
+	assert match('ip-src', '2001:db8::1') is None
+
+def test_overlapping_prefixes():
+	# 10.1.0.0/16 is inside 10.0.0.0/8.  Either list will do for ip-dst,
+	# but only RFC1918 applies to ip-src.
+	assert match('ip-dst', '10.1.2.3') in ('RFC1918', 'Resolvers')
+	assert match('ip-src', '10.1.2.3') == 'RFC1918'
+
+def test_domain():
+	assert match('domain', 'google.com') == 'Top sites'
+	assert match('domain', 'www.google.com') == 'Top sites'
+	assert match('hostname', 'a.b.microsoft.com') == 'Top sites'
+	assert match('domain', 'notgoogle.com') is None
+	assert match('domain', 'google.com.evil.com') is None
+
+def test_uri_host():
+	assert match('uri', 'http://www.google.com/x') == 'Top sites'
+	assert match('uri', 'www.google.com/x') == 'Top sites'
+	assert match('uri', 'http://10.1.2.3/x') == 'RFC1918'
+	assert match('uri', 'http://evil.com/google.com') is None
+
+def test_email_domain():
+	assert match('email-src', 'someone@google.com') == 'Top sites'
+	assert match('email-src', 'someone@evil.com') is None
+
+def test_filename_md5_against_bare_hash_list():
+	assert match('filename|md5', 'x.txt|' + EMPTY_MD5) == 'Empty hashes'
+	assert match('md5', EMPTY_MD5) == 'Empty hashes'
+
+def test_matching_attributes_do_not_apply():
+	# a.exe is on a list for md5 attributes only
+	assert match('filename|md5', 'a.exe|0123456789abcdef0123456789abcdef') is None
+	assert match('filename', 'a.exe') is None
+	assert match('ip-src', '8.8.8.8') is None
+	assert match('comment', 'google.com') is None
+
+def attributes():
+	return [
+		{ 'type' : 'ip-src', 'value' : '10.1.2.3',    'to_ids' : 1 },
+		{ 'type' : 'domain', 'value' : 'evil.com',    'to_ids' : 1 },
+		{ 'type' : 'uri',    'value' : 'http://www.google.com/x', 'to_ids' : 1 }
+	]
+
+def test_filter_drop():
+	filtered = list(make_warninglists().filter(attributes(), 'drop'))
+	assert [attribute['value'] for attribute in filtered] == ['evil.com']
+
+def test_filter_no_ids():
+	filtered = list(make_warninglists().filter(attributes(), 'no-ids'))
+	assert [(attribute['value'], attribute['to_ids']) for attribute in filtered] == [
+		('10.1.2.3', 0),
+		('evil.com', 1),
+		('http://www.google.com/x', 0)
+	]
+
+def test_filter_bad_action():
+	with pytest.raises(ValueError):
+		list(make_warninglists().filter(attributes(), 'ignore'))